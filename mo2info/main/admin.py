@@ -1,13 +1,183 @@
-from django.contrib import admin
+import time
 
-from .models import BowDamagePredictor, BowDamageTrial
+from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.db.models.lookups import LessThan
+from django.utils.functional import cached_property
+
+from .data_versions import batched_notifications, notify_data_changed
+from .models import BowDamagePredictor, BowDamageTrial, GameEpoch
+from .refits import get_progress, refit_in_background
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses the planner's row estimate instead of `COUNT(*)` for unfiltered
+     querysets on Postgres, since an exact count of a big table is a full scan.
+     Keyset pages (see `KeysetChangeList`) count as unfiltered: only the page
+     links use the count, and counting the rows before the keyset would be
+     nearly as slow.
+    """
+
+    @staticmethod
+    def _is_unfiltered(queryset: QuerySet) -> bool:
+        return all(
+            isinstance(lookup, LessThan) and lookup.lhs.target.primary_key
+            for lookup in queryset.query.where.children
+        )
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql" and self._is_unfiltered(queryset):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class "
+                    "WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            # the estimate is -1 until the table has been analyzed
+            if row and row[0] >= 0:
+                return row[0]
+        return super().count
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Adds a link to the next page that filters on `id__lt` rather than using
+     an OFFSET, which gets slower the deeper you page into a big table. This
+     only works in the default (`-id`) order, so there's no link when the
+     list is sorted by another column.
+    """
+
+    @property
+    def next_keyset_query_string(self) -> str:
+        if (
+            ORDER_VAR in self.params
+            or len(self.result_list) < self.list_per_page
+        ):
+            return ""
+        return self.get_query_string(
+            {"id__lt": self.result_list[len(self.result_list) - 1].pk},
+            [PAGE_VAR],
+        )
+
+
+class BatchedNotificationsAdmin(admin.ModelAdmin):
+    """
+    Notifies predictors about changed data once per admin request, rather
+     than once per edited or deleted row
+    """
+
+    def changelist_view(self, request, extra_context=None):
+        with batched_notifications():
+            return super().changelist_view(request, extra_context)
+
+    def delete_queryset(self, request, queryset) -> None:
+        # `QuerySet.delete` skips `Model.delete`, so we have to notify here
+        super().delete_queryset(request, queryset)
+        notify_data_changed(queryset.model)
+
+
+class RangeListFilter(admin.SimpleListFilter):
+    """Filters on (indexed) buckets of tooltip range"""
+
+    title = "range"
+    parameter_name = "range_bucket"
+    BUCKET_SIZE = 10
+
+    def lookups(self, request, model_admin):
+        return [
+            (str(start), f"{start} – {start + self.BUCKET_SIZE}")
+            for start in range(0, 100, self.BUCKET_SIZE)
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        if self.value() not in dict(self.lookup_choices):
+            raise IncorrectLookupParameters(
+                f"Invalid {self.parameter_name}: {self.value()}"
+            )
+        start = int(self.value())
+        return queryset.filter(
+            range__gte=start, range__lt=start + self.BUCKET_SIZE
+        )
 
 
 @admin.register(BowDamageTrial)
-class BowDamageTrialAdmin(admin.ModelAdmin):
-    ...
+class BowDamageTrialAdmin(BatchedNotificationsAdmin):
+    list_display = (
+        "id",
+        "bow_type",
+        "range",
+        "durability_current",
+        "durability_max",
+        "mean_damage",
+        "epoch",
+    )
+    list_editable = ("bow_type", "range")
+    list_filter = ("epoch", "bow_type", RangeListFilter)
+    list_select_related = ("epoch",)
+    list_per_page = 100
+    ordering = ("-id",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
 
 
 @admin.register(BowDamagePredictor)
 class BowDamagePredictorAdmin(admin.ModelAdmin):
-    ...
+    # only plain fields, so that listing doesn't fit any predictors
+    list_display = (
+        "id",
+        "formula",
+        "estimator",
+        "queryset_filter",
+        "epoch",
+        "epoch_window",
+    )
+    list_filter = ("estimator", "epoch")
+    list_select_related = ("epoch",)
+    actions = ["refit"]
+
+    @admin.action(description="Refit selected predictors in the background")
+    def refit(self, request, queryset) -> None:
+        count = refit_in_background(queryset)
+        self.message_user(
+            request,
+            f"Refitting {count} predictor(s); reload this page for progress",
+        )
+
+    def changelist_view(self, request, extra_context=None):
+        progress = get_progress(self.model)
+        # report on refits that are running or that finished recently
+        if progress and (
+            progress["finished"] is None
+            or time.time() - progress["finished"] < 5 * 60
+        ):
+            status = f"Refit: {progress['done']}/{progress['total']} done"
+            if progress["failed"]:
+                status += f", failed: {', '.join(progress['failed'])}"
+            if progress["finished"]:
+                elapsed = progress["finished"] - progress["started"]
+                status += f" (took {elapsed:.1f}s)"
+            self.message_user(
+                request,
+                status,
+                messages.WARNING if progress["failed"] else messages.INFO,
+            )
+        return super().changelist_view(request, extra_context)
+
+
+@admin.register(GameEpoch)
+class GameEpochAdmin(admin.ModelAdmin):
+    list_display = ("name", "started_at", "frozen")
@@ -0,0 +1,143 @@
+"""
+Tracks the version of the data in each model that predictors are fit to.
+
+Every write to the data bumps a counter in the `DataVersionCounter` table,
+ in the same transaction as the write, so the version changes whenever any
+ row is added, edited or deleted. The current version is kept in the
+ (container-local) cache so that instantiating a predictor doesn't query the
+ DB. Writes publish a Postgres `NOTIFY` on `settings.DATA_CHANGED_CHANNEL`,
+ and the `listen_for_data_changes` command running in each container
+ refreshes its local version when one arrives. The cached version also
+ expires after `settings.DATA_VERSION_TIMEOUT` seconds, which bounds
+ staleness if a notification is ever missed.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, NamedTuple, Optional, Type
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, models, transaction
+from django.db.models import F
+
+# model -> whether only new rows were added (see `notify_data_changed`)
+_batched_changes: ContextVar[
+    Optional[dict[Type[models.Model], bool]]
+] = ContextVar("batched_changes", default=None)
+
+
+class DataVersion(NamedTuple):
+    version: int  # bumped by every write
+    # bumped by writes that change existing rows, i.e. not just inserts
+    generation: int
+    # the last row as of this version, so that reads (e.g. from a lagging
+    #  replica) can be limited to the rows up to it
+    last_id: int
+
+
+def _cache_key(model: Type[models.Model]) -> str:
+    return f"data_version:{model._meta.label_lower}"
+
+
+def _counters(using: str = DEFAULT_DB_ALIAS) -> models.QuerySet:
+    # looked up lazily since the models use this module
+    return apps.get_model("main", "DataVersionCounter").objects.using(using)
+
+
+def stored_version(model: Type[models.Model], using: str) -> int:
+    """The version of `model`'s data in the DB `using`, e.g. a replica"""
+    return (
+        _counters(using)
+        .filter(label=model._meta.label)
+        .values_list("version", flat=True)
+        .first()
+    ) or 0
+
+
+def refresh_data_version(model: Type[models.Model]) -> DataVersion:
+    """Looks up the current version of `model`'s data and caches it"""
+    # these always go to the primary, which a replica may be lagging behind
+    counter = (
+        _counters()
+        .filter(label=model._meta.label)
+        .values_list("version", "generation")
+        .first()
+    ) or (0, 0)
+    last_id = (
+        model._default_manager.using(DEFAULT_DB_ALIAS)
+        .order_by("id")
+        .values_list("id", flat=True)
+        .last()
+    ) or 0
+    version = DataVersion(*counter, last_id=last_id)
+    cache.set(_cache_key(model), version, settings.DATA_VERSION_TIMEOUT)
+    return version
+
+
+def get_data_version(model: Type[models.Model]) -> DataVersion:
+    version = cache.get(_cache_key(model))
+    if version is None:
+        version = refresh_data_version(model)
+    return version
+
+
+def _bump_counter(model: Type[models.Model], inserted_only: bool) -> None:
+    counters = _counters().filter(label=model._meta.label)
+    changes = {"version": F("version") + 1}
+    if not inserted_only:
+        changes["generation"] = F("generation") + 1
+    if not counters.update(**changes):
+        _counters().get_or_create(label=model._meta.label)
+        counters.update(**changes)
+
+
+def notify_data_changed(
+    model: Type[models.Model], inserted_only: bool = False
+) -> None:
+    """
+    Bumps the version of `model`'s data as part of the current transaction.
+     Once that commits, the local version is dropped straight away, and
+     other containers are notified via Postgres (if that's the DB in use).
+     Pass `inserted_only` if the only change was adding new rows, so that
+     samples of the existing rows can be kept (see `sampling`).
+    """
+
+    batched_changes = _batched_changes.get()
+    if batched_changes is not None:
+        batched_changes[model] = inserted_only and batched_changes.get(
+            model, True
+        )
+        return
+
+    _bump_counter(model, inserted_only)
+
+    def notify() -> None:
+        cache.delete(_cache_key(model))
+        if connection.vendor != "postgresql":
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_notify(%s, %s)",
+                [settings.DATA_CHANGED_CHANNEL, model._meta.label],
+            )
+
+    transaction.on_commit(notify)
+
+
+@contextmanager
+def batched_notifications() -> Iterator[None]:
+    """
+    Collects the data changes made inside the block (e.g. a bulk edit) and
+     notifies each changed model once at the end, instead of once per row
+    """
+    changed_models: dict[Type[models.Model], bool] = {}
+    token = _batched_changes.set(changed_models)
+    try:
+        yield
+    finally:
+        _batched_changes.reset(token)
+        # if the block's transaction failed, its changes will be rolled back
+        if not connection.needs_rollback:
+            for model, inserted_only in changed_models.items():
+                notify_data_changed(model, inserted_only)
@@ -0,0 +1,289 @@
+"""
+Estimator backends for `CachedRegressionPredictor`.
+
+The patsy design matrices for a partition of the data are built once per
+ `(target_model, queryset_filter, formula, data version)` and kept in a
+ per-process LRU cache as NumPy arrays, so every estimator (and any
+ diagnostic) fit to the same partition reuses them instead of re-querying
+ the DB and re-encoding the formula. Only the newest version of each
+ partition is kept.
+"""
+import json
+import threading
+from collections import OrderedDict
+from math import sqrt
+from typing import Any, Callable, NamedTuple, Optional, Type
+
+import numpy as np
+import statsmodels.api as sm
+from django.db import models
+from pandas import DataFrame, Series
+from patsy import DesignInfo, dmatrices
+from statsmodels.base.wrapper import ResultsWrapper
+
+from mo2info.routers import read_database
+
+from . import sampling
+from .data_versions import DataVersion
+
+
+class DesignMatrices(NamedTuple):
+    """The encoded data for one partition, shared by all its estimators"""
+
+    formula: str
+    frame: DataFrame  # the source rows, aligned with `endog` and `exog`
+    endog: np.ndarray
+    exog: np.ndarray
+    endog_name: str
+    design_info: DesignInfo
+    # how many rows matched, if `frame` is only a sample of them
+    population: Optional[int] = None
+
+    @property
+    def exog_names(self) -> list[str]:
+        return self.design_info.column_names
+
+
+def encode(
+    frame: DataFrame, formula: str, population: Optional[int] = None
+) -> Optional[DesignMatrices]:
+    """Builds the design matrices for `formula` over the rows in `frame`"""
+    if frame.empty:
+        return None
+    endog, exog = dmatrices(formula, frame, return_type="dataframe")
+    return DesignMatrices(
+        formula=formula,
+        frame=frame.loc[exog.index],  # patsy drops rows with missing values
+        endog=endog.to_numpy().ravel(),
+        exog=exog.to_numpy(),
+        endog_name=endog.columns[0],
+        design_info=exog.design_info,
+        population=population,
+    )
+
+
+DESIGN_CACHE_SIZE = 32
+
+# only the newest version of each partition is kept, as `(version, design)`,
+#  so that every write doesn't leave another copy of the data behind
+_design_cache: "OrderedDict[tuple, tuple[int, Optional[DesignMatrices]]]" = (
+    OrderedDict()
+)
+_design_cache_lock = threading.Lock()
+
+
+def _design_cache_key(
+    target_model: Type[models.Model],
+    queryset_filter: dict,
+    formula: str,
+    max_rows: Optional[int],
+) -> tuple:
+    return (
+        target_model._meta.label,
+        json.dumps(queryset_filter, sort_keys=True),
+        formula,
+        max_rows,
+    )
+
+
+def _get_cached_design(
+    key: tuple, data_version: DataVersion
+) -> tuple[bool, Optional[DesignMatrices]]:
+    """Whether `key` is cached as of `data_version`, and its design if so"""
+    with _design_cache_lock:
+        cached = _design_cache.get(key)
+        if cached is None or cached[0] != data_version.version:
+            return False, None
+        _design_cache.move_to_end(key)
+        return True, cached[1]
+
+
+def _cache_design(
+    key: tuple, data_version: DataVersion, design: Optional[DesignMatrices]
+) -> None:
+    with _design_cache_lock:
+        cached = _design_cache.get(key)
+        # e.g. a slow fit of older data mustn't replace a newer one
+        if cached is not None and cached[0] > data_version.version:
+            return
+        _design_cache[key] = (data_version.version, design)
+        _design_cache.move_to_end(key)
+        while len(_design_cache) > DESIGN_CACHE_SIZE:
+            _design_cache.popitem(last=False)
+
+
+def get_design_matrices(
+    target_model: Type[models.Model],
+    queryset_filter: dict,
+    formula: str,
+    data_version: DataVersion,
+    max_rows: Optional[int] = None,
+) -> Optional[DesignMatrices]:
+    """
+    Returns the (possibly cached) design matrices for `formula` over
+     `target_model.objects.filter(**queryset_filter)` as of `data_version`,
+     or None if there is no matching data. With `max_rows`, only a uniform
+     sample of at most that many rows is used (see `sampling`).
+    """
+    key = _design_cache_key(target_model, queryset_filter, formula, max_rows)
+    cached, design = _get_cached_design(key, data_version)
+    if cached:
+        return design
+
+    if max_rows:
+        sample = sampling.get_sample(
+            target_model, queryset_filter, max_rows, data_version
+        )
+        design = encode(sample.frame, formula, sample.population)
+    else:
+        frame = DataFrame(
+            target_model._default_manager.using(
+                read_database(target_model, data_version)
+            )
+            .filter(id__lte=data_version.last_id, **queryset_filter)
+            .values()
+        )
+        design = encode(frame, formula)
+    _cache_design(key, data_version, design)
+    return design
+
+
+def seed_design_matrices(
+    target_model: Type[models.Model],
+    queryset_filter: dict,
+    formula: str,
+    data_version: DataVersion,
+    frame: DataFrame,
+    max_rows: Optional[int] = None,
+    population: Optional[int] = None,
+) -> Optional[DesignMatrices]:
+    """
+    Encodes and caches the design matrices for data that was already loaded
+     elsewhere, e.g. by a batch refit that scans the whole table once
+    """
+    key = _design_cache_key(target_model, queryset_filter, formula, max_rows)
+    cached, design = _get_cached_design(key, data_version)
+    if cached:
+        return design
+    design = encode(frame, formula, population)
+    _cache_design(key, data_version, design)
+    return design
+
+
+Estimator = Callable[[DesignMatrices, dict[str, Any]], ResultsWrapper]
+
+ESTIMATORS: dict[str, Estimator] = {}
+
+
+def register(name: str) -> Callable[[Estimator], Estimator]:
+    """Decorator that makes an estimator available under `name`"""
+
+    def decorator(estimator: Estimator) -> Estimator:
+        ESTIMATORS[name] = estimator
+        return estimator
+
+    return decorator
+
+
+def fit(
+    name: str, design: DesignMatrices, options: dict[str, Any]
+) -> ResultsWrapper:
+    """Fits the estimator registered as `name` to `design`"""
+    try:
+        estimator = ESTIMATORS[name]
+    except KeyError:
+        raise ValueError(f"Unknown estimator: {name}")
+    return estimator(design, options)
+
+
+def fit_and_summarize(
+    name: str, design: Optional[DesignMatrices], options: dict[str, Any]
+) -> tuple[Optional[ResultsWrapper], str]:
+    """
+    Fits the estimator registered as `name` to `design` and returns the
+     results with an HTML summary, or None with a description of the problem
+    """
+    if design is None:
+        return None, "No Data"
+    try:
+        predictor = fit(name, design, options)
+        summary: str = predictor.summary().as_html()
+    except Exception as e:
+        return None, repr(e)
+    if design.population and design.population > len(design.frame):
+        sample_size = len(design.endog)
+        summary = (
+            f"<p>Fit to a uniform sample of {sample_size} of the "
+            f"{design.population} matching rows; standard errors are about "
+            f"{sqrt(design.population / sample_size):.1f}x those of a fit to "
+            "all of them.</p>"
+        ) + summary
+    return predictor, summary
+
+
+def fit_frame(
+    name: str,
+    frame: DataFrame,
+    formula: str,
+    options: dict[str, Any],
+    population: Optional[int] = None,
+) -> tuple[Optional[ResultsWrapper], str]:
+    """
+    `fit_and_summarize` for raw data; unlike `DesignMatrices`, the arguments
+     and results can be pickled, so this can run in another process
+    """
+    try:
+        design = encode(frame, formula, population)
+    except Exception as e:
+        return None, repr(e)
+    return fit_and_summarize(name, design, options)
+
+
+def _formula_model(model_class: type, design: DesignMatrices, **kwargs):
+    """
+    Equivalent of `model_class.from_formula`, but built from the cached
+     matrices; the formula metadata lets the results `predict` from a dict
+     of raw regressor values like formula-API models do
+    """
+    model = model_class(
+        Series(design.endog, name=design.endog_name, index=design.frame.index),
+        DataFrame(
+            design.exog,
+            columns=design.exog_names,
+            index=design.frame.index,
+        ),
+        formula=design.formula,
+        design_info=design.design_info,
+        **kwargs,
+    )
+    model.formula = design.formula
+    # needed to restore the design info when the results are unpickled
+    model.data.frame = design.frame
+    return model
+
+
+@register("OLS")
+def ols(design: DesignMatrices, options: dict[str, Any]) -> ResultsWrapper:
+    return _formula_model(sm.OLS, design).fit()
+
+
+@register("WLS")
+def wls(design: DesignMatrices, options: dict[str, Any]) -> ResultsWrapper:
+    """`options["weights"]` names the column holding the weights"""
+    weights = design.frame[options["weights"]].to_numpy(dtype=float)
+    return _formula_model(sm.WLS, design, weights=weights).fit()
+
+
+@register("RLM")
+def rlm(design: DesignMatrices, options: dict[str, Any]) -> ResultsWrapper:
+    """Robust regression with Huber's T norm, tuned by `options["t"]`"""
+    norm = sm.robust.norms.HuberT(t=options.get("t", 1.345))
+    return _formula_model(sm.RLM, design, M=norm).fit()
+
+
+@register("QUANTREG")
+def quantreg(
+    design: DesignMatrices, options: dict[str, Any]
+) -> ResultsWrapper:
+    """Quantile regression for `options["q"]` (the median by default)"""
+    return _formula_model(sm.QuantReg, design).fit(q=options.get("q", 0.5))
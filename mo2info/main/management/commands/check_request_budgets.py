@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import URLPattern, get_resolver, reverse
+
+from mo2info.main.models import BowDamagePredictor, BowDamageTrial
+from mo2info.profiling import RequestBudget, record_request_stats
+from mo2info.routers import ReadYourWritesMiddleware
+
+# a few trials per bow type, so that every view has something to do
+FIXTURE_TRIALS = [
+    (bow_type, range, damage)
+    for bow_type in BowDamageTrial.BowTypeChoices.values
+    for range, damage in [(30, 80), (40, 105), (50, 130)]
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks that a warm request to each view with a `request_budget` "
+        "makes no more DB queries and cache calls than its budget allows. "
+        "Runs against fixture data in a transaction that is rolled back, "
+        "with a local in-memory cache."
+    )
+
+    def handle(self, *args, **options) -> None:
+        failures = []
+        with override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.locmem."
+                    "LocMemCache",
+                    "LOCATION": "check_request_budgets",
+                }
+            },
+            # the fixture fits mustn't overwrite the published manifest
+            PREDICTION_MANIFEST_PATH=None,
+        ), transaction.atomic():
+            for bow_type, range, damage in FIXTURE_TRIALS:
+                BowDamageTrial(
+                    bow_type=bow_type,
+                    range=range,
+                    durability_current=50,
+                    durability_max=100,
+                    damage_log="\n".join([str(damage)] * 10),
+                ).save()
+            # several predictors, so that a view whose calls grow with the
+            #  number of predictors goes over budget
+            for bow_type in BowDamagePredictor.BOW_TYPE_FILTERS:
+                BowDamagePredictor.for_bow_type(bow_type)
+            BowDamagePredictor.objects.create(
+                **{
+                    **BowDamagePredictor.default_lookup("LONG"),
+                    "estimator": BowDamagePredictor.EstimatorChoices.RLM,
+                }
+            )
+
+            client = Client()
+            # the fixtures only exist in this transaction on the primary
+            client.cookies[ReadYourWritesMiddleware.COOKIE_NAME] = "1"
+            for pattern in get_resolver().url_patterns:
+                view_class = getattr(
+                    getattr(pattern, "callback", None), "view_class", None
+                )
+                budget = getattr(view_class, "request_budget", None)
+                if budget:
+                    failure = self._check(client, pattern, budget)
+                    if failure:
+                        failures.append(failure)
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError("\n\n".join(failures))
+
+    def _check(
+        self, client: Client, pattern: URLPattern, budget: RequestBudget
+    ) -> str:
+        url = reverse(pattern.name)
+        request = getattr(client, budget.method.lower())
+        # the first request warms the caches (e.g. fits the predictors)
+        request(url, budget.data or {})
+        with record_request_stats() as stats:
+            request(url, budget.data or {})
+
+        queries = len(stats.queries)
+        cache_calls = sum(stats.cache_calls.values())
+        self.stdout.write(
+            f"{pattern.name}: {queries}/{budget.queries} queries, "
+            f"{cache_calls}/{budget.cache_calls} cache calls"
+        )
+        if queries > budget.queries or cache_calls > budget.cache_calls:
+            return f"{pattern.name} is over budget:\n{stats.report()}"
+        return ""
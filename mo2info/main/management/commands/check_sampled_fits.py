@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+
+from mo2info.main.data_versions import notify_data_changed
+from mo2info.main.models import BowDamagePredictor, BowDamageTrial
+from mo2info.main.refits import refit_all
+from mo2info.main.sampling import CHUNK_SIZE
+
+SAMPLE_SIZE = CHUNK_SIZE // 2
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks that a predictor with a `max_training_rows` fits to a sample "
+        "of data that spans several chunks, whether it's fit on its own, by "
+        "`refit_all`, or in a process pool. Runs against fixture data in a "
+        "transaction that is rolled back, with a local in-memory cache."
+    )
+
+    def handle(self, *args, **options) -> None:
+        failures = []
+        with override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.locmem."
+                    "LocMemCache",
+                    "LOCATION": "check_sampled_fits",
+                }
+            },
+            PREDICTION_MANIFEST_PATH=None,
+        ), transaction.atomic():
+            # only every other trial matches, so the matching rows (and the
+            #  sample of them) span more than one chunk whether the table or
+            #  just the matching rows are streamed
+            BowDamageTrial.objects.bulk_create(
+                BowDamageTrial(
+                    bow_type="LONG" if i % 2 else "SHORT",
+                    range=30 + i % 40,
+                    durability_current=50,
+                    durability_max=100,
+                    durability_pct=0.5,
+                    damage_log="",
+                    mean_damage=2 * (30 + i % 40) + i % 7,
+                )
+                for i in range(5 * CHUNK_SIZE // 2)
+            )
+            notify_data_changed(BowDamageTrial)
+
+            predictor = BowDamagePredictor.objects.create(
+                formula=BowDamagePredictor.DEFAULT_FORMULA,
+                queryset_filter={"bow_type": "SHORT"},
+                max_training_rows=SAMPLE_SIZE,
+            )
+            failures.append(self._check("fit", predictor.id))
+            for processes in (0, 2):
+                # so that it has to be refit
+                notify_data_changed(BowDamageTrial)
+                refit_all(
+                    [BowDamagePredictor.objects.get(id=predictor.id)],
+                    processes=processes,
+                )
+                failures.append(
+                    self._check(f"refit_all({processes=})", predictor.id)
+                )
+            transaction.set_rollback(True)
+
+        failures = [failure for failure in failures if failure]
+        if failures:
+            raise CommandError("\n".join(failures))
+
+    def _check(self, fit: str, predictor_id: int) -> str:
+        value = BowDamagePredictor.objects.get(id=predictor_id).get_cached()
+        predictor = value["predictor"] if value else None
+        nobs = int(predictor.nobs) if predictor else 0
+        self.stdout.write(f"{fit}: {nobs}/{SAMPLE_SIZE} rows")
+        if nobs != SAMPLE_SIZE:
+            return f"{fit} failed: {value['summary'] if value else 'not fit'}"
+        return ""
@@ -0,0 +1,96 @@
+import logging
+import select
+import time
+from typing import Iterable, Type
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, models
+
+from mo2info.main.data_versions import refresh_data_version
+from mo2info.main.models import CachedDamagePredictor
+from mo2info.main.refits import refit_all
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Listens for data change notifications from Postgres and refreshes "
+        "this container's cached data versions (and optionally refits the "
+        "affected predictors). Run one per container."
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--prefetch",
+            action="store_true",
+            help="Refit the affected predictors as soon as data changes, "
+            "rather than on their next use",
+        )
+
+    def handle(self, *args, prefetch: bool = False, **options) -> None:
+        while True:
+            try:
+                self._listen(prefetch)
+            except OperationalError:
+                logger.exception("Lost the DB connection, reconnecting")
+                connection.close()
+                time.sleep(5)
+
+    def _listen(self, prefetch: bool) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN "{settings.DATA_CHANGED_CHANNEL}"')
+        # anything could have changed while we weren't listening
+        self._refresh(self._target_models(), prefetch)
+
+        pg_connection = connection.connection
+        while True:
+            # notifications that arrive while we query on this connection
+            #  (e.g. while refitting) are taken off the socket then, so they
+            #  have to be picked up before waiting on it
+            labels = self._pop_notifications(pg_connection)
+            if not labels:
+                select.select(
+                    [pg_connection], [], [], settings.DATA_VERSION_TIMEOUT
+                )
+                pg_connection.poll()
+                labels = self._pop_notifications(pg_connection)
+            if labels:
+                self._refresh(
+                    [apps.get_model(label) for label in labels], prefetch
+                )
+
+    @staticmethod
+    def _pop_notifications(pg_connection) -> set[str]:
+        labels = {notify.payload for notify in pg_connection.notifies}
+        pg_connection.notifies.clear()
+        return labels
+
+    @staticmethod
+    def _target_models() -> set[Type[models.Model]]:
+        return {
+            predictor_model.target_model
+            for predictor_model in apps.get_models()
+            if issubclass(predictor_model, CachedDamagePredictor)
+        }
+
+    @staticmethod
+    def _refresh(
+        target_models: Iterable[Type[models.Model]], prefetch: bool
+    ) -> None:
+        for target_model in target_models:
+            version = refresh_data_version(target_model)
+            logger.info(
+                f"{target_model._meta.label} is at version {version.version}"
+            )
+            if not prefetch:
+                continue
+            refit_all(
+                predictor
+                for predictor_model in apps.get_models()
+                if issubclass(predictor_model, CachedDamagePredictor)
+                and predictor_model.target_model is target_model
+                for predictor in predictor_model.objects.all()
+            )
@@ -0,0 +1,31 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from mo2info.main.models import CachedDamagePredictor
+from mo2info.main.refits import refit_all
+
+
+class Command(BaseCommand):
+    help = (
+        "Refits every predictor from a single scan of each table they're fit "
+        "to (which also updates the prediction manifest)"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=0,
+            help="Solve the models across a pool of this many processes",
+        )
+
+    def handle(self, *args, processes: int = 0, **options) -> None:
+        refit_all(
+            (
+                predictor
+                for predictor_model in apps.get_models()
+                if issubclass(predictor_model, CachedDamagePredictor)
+                for predictor in predictor_model.objects.all()
+            ),
+            processes=processes,
+        )
@@ -0,0 +1,107 @@
+"""
+A compact, versioned manifest of the active bow damage predictors, with
+ everything a client needs to compute predictions locally: coefficients,
+ term definitions, interval data, and which predictor to use per bow type.
+ It is served by `BowDamagePredictionManifestView`, so clients only need to
+ re-fetch it when its `version` changes.
+
+The manifest is only ever built from fits that are already cached, never by
+ fitting predictors itself. It's updated whenever a new fit is cached (see
+ `BowDamagePredictor.fit_cached`); a predictor that hasn't been refit since
+ the data changed keeps its last entry until it is. Each update is also
+ written to `settings.PREDICTION_MANIFEST_PATH`, which can be served as a
+ static file and which seeds the cached manifest after a cache restart.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .data_versions import get_data_version
+from .models import BowDamagePredictor, BowDamageTrial
+
+CACHE_KEY = "bow_damage_manifest"
+
+
+def build_manifest(
+    previous: Optional[dict[str, Any]] = None
+) -> dict[str, Any]:
+    """
+    Builds the manifest from the cached fits, keeping the entries from the
+     `previous` manifest for predictors that haven't been fit since
+    """
+    previous_entries = previous["predictors"] if previous else {}
+    defaults = {
+        bow_type: BowDamagePredictor.default_lookup(bow_type)
+        for bow_type in BowDamagePredictor.BOW_TYPE_FILTERS
+    }
+    predictors = {}
+    routes = {}
+    # in id order, so each route goes to the same predictor as `for_bow_type`
+    for predictor in BowDamagePredictor.objects.all():
+        entry = predictor.manifest_entry()
+        if entry is None:
+            entry = previous_entries.get(str(predictor.id))
+        if entry is None:
+            continue
+        predictors[str(predictor.id)] = entry
+        for bow_type, lookup in defaults.items():
+            if bow_type not in routes and all(
+                getattr(predictor, field) == value
+                for field, value in lookup.items()
+            ):
+                routes[bow_type] = predictor.id
+
+    content = {
+        "data_version": get_data_version(BowDamageTrial).version,
+        "routes": {"bow_type": routes},
+        "predictors": predictors,
+    }
+    serialized = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return {
+        "version": hashlib.sha256(serialized.encode()).hexdigest()[:16],
+        **content,
+    }
+
+
+def _read_manifest_file() -> Optional[dict[str, Any]]:
+    path = settings.PREDICTION_MANIFEST_PATH
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def _write_manifest_file(manifest: dict[str, Any]) -> None:
+    path = settings.PREDICTION_MANIFEST_PATH
+    if not path:
+        return
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # write then rename, so nobody ever reads a half-written file (with a
+    #  unique name, since several threads may be refitting at once)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as manifest_file:
+        json.dump(manifest, manifest_file, separators=(",", ":"))
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def update_manifest() -> dict[str, Any]:
+    """Rebuilds the manifest with the latest fits, and caches and writes it"""
+    previous = cache.get(CACHE_KEY) or _read_manifest_file()
+    manifest = build_manifest(previous)
+    cache.set(CACHE_KEY, manifest, None)
+    _write_manifest_file(manifest)
+    return manifest
+
+
+def get_manifest() -> dict[str, Any]:
+    manifest = cache.get(CACHE_KEY)
+    if manifest is None:
+        manifest = update_manifest()
+    return manifest
@@ -0,0 +1,36 @@
+# Generated by Django 4.0.3 on 2026-10-19 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0006_alter_bowdamagepredictor_options_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bowdamagepredictor",
+            name="estimator",
+            field=models.CharField(
+                choices=[
+                    ("OLS", "Ordinary least squares"),
+                    ("WLS", "Weighted least squares"),
+                    ("RLM", "Robust linear model (Huber)"),
+                    ("QUANTREG", "Quantile regression"),
+                ],
+                default="OLS",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="bowdamagepredictor",
+            name="estimator_options",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text='Extra estimator arguments, e.g. `{"weights": "durability_pct"}` for WLS or `{"q": 0.9}` for quantile regression',
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.1.13 on 2026-10-19 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0007_bowdamagepredictor_estimator"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="bowdamagetrial",
+            index=models.Index(
+                fields=["bow_type", "range"],
+                name="main_bowdam_bow_typ_4afe0f_idx",
+            ),
+        ),
+    ]
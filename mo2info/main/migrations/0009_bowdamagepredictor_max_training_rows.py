@@ -0,0 +1,22 @@
+# Generated by Django 4.1.13 on 2026-10-19 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0008_bowdamagetrial_bow_type_range_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bowdamagepredictor",
+            name="max_training_rows",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Fit to a uniform sample of at most this many rows, to bound the memory and time a fit takes (leave blank to use all rows)",
+                null=True,
+            ),
+        ),
+    ]
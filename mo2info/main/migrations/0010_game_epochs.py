@@ -0,0 +1,110 @@
+# Generated by Django 4.1.13 on 2026-10-19 11:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def assign_initial_epoch(apps, schema_editor):
+    """Puts the trials recorded so far into an epoch of their own"""
+    BowDamageTrial = apps.get_model("main", "BowDamageTrial")
+    GameEpoch = apps.get_model("main", "GameEpoch")
+    trials = BowDamageTrial.objects.filter(epoch__isnull=True)
+    if trials.exists():
+        epoch = GameEpoch.objects.create(
+            name="Before epochs were tracked",
+            started_at=django.utils.timezone.now(),
+        )
+        trials.update(epoch=epoch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0009_bowdamagepredictor_max_training_rows"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GameEpoch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        help_text="E.g. the game patch version",
+                        max_length=100,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "frozen",
+                    models.BooleanField(
+                        default=False,
+                        help_text="Whether the epoch is over and its data is final (this can't be undone for predictors that were already fit to it)",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("started_at",),
+            },
+        ),
+        migrations.AddField(
+            model_name="bowdamagepredictor",
+            name="epoch_window",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                help_text="Only fit to the trials from the latest N epochs, e.g. 1 for the current epoch (ignored if `epoch` is set; leave both blank to use all history)",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="bowdamagetrial",
+            name="created_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+        migrations.AddField(
+            model_name="bowdamagepredictor",
+            name="epoch",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Only fit to the trials from this epoch",
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="main.gameepoch",
+            ),
+        ),
+        migrations.AddField(
+            model_name="bowdamagetrial",
+            name="epoch",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Defaults to the current epoch",
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="main.gameepoch",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bowdamagetrial",
+            index=models.Index(
+                fields=["epoch", "bow_type"],
+                name="main_bowdam_epoch_i_f35586_idx",
+            ),
+        ),
+        migrations.RunPython(assign_initial_epoch, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.1.13 on 2026-10-19 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0010_game_epochs"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DataVersionCounter",
+            fields=[
+                (
+                    "label",
+                    models.CharField(
+                        max_length=200, primary_key=True, serialize=False
+                    ),
+                ),
+                ("version", models.PositiveBigIntegerField(default=0)),
+                ("generation", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -1,14 +1,100 @@
 import re
 from abc import abstractmethod
-from typing import Optional, Type, TypedDict
+from datetime import datetime
+from typing import Any, Optional, Type, TypedDict
 
+from django.conf import settings
 from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from django.utils import timezone
 from django.utils.functional import cached_property
 from pandas import DataFrame
 from statsmodels.base.wrapper import ResultsWrapper
-from statsmodels.formula.api import ols
+
+from . import estimators
+from .data_versions import DataVersion, get_data_version, notify_data_changed
+
+
+class DataVersionCounter(models.Model):
+    """
+    Counts the writes to a model's data, to version the predictors fit to
+     it; see `data_versions`
+    """
+
+    label = models.CharField(max_length=200, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    generation = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.label} v{self.version}"
+
+
+class GameEpoch(models.Model):
+    """
+    A period of the game between balance changes (e.g. a patch). Trials are
+     assigned to the epoch that was current when they were recorded, so that
+     predictors can be fit to recent epochs only. Once an epoch is over, it
+     can be frozen: predictors for a frozen epoch are never refit.
+    """
+
+    name = models.CharField(
+        max_length=100, unique=True, help_text="E.g. the game patch version"
+    )
+    started_at = models.DateTimeField(default=timezone.now)
+    frozen = models.BooleanField(
+        default=False,
+        help_text="Whether the epoch is over and its data is final (this "
+        "can't be undone for predictors that were already fit to it)",
+    )
+
+    class Meta:
+        ordering = ("started_at",)
+
+    @classmethod
+    def _cached_epochs(cls) -> list[tuple[int, datetime, bool]]:
+        # epochs are versioned like the trials, so other containers learn
+        #  about changes from the notifications described in `data_versions`
+        cache_key = f"game_epochs:{get_data_version(cls).version}"
+        epochs = cache.get(cache_key)
+        if epochs is None:
+            epochs = list(
+                cls.objects.values_list("id", "started_at", "frozen")
+            )
+            cache.set(cache_key, epochs, settings.DATA_VERSION_TIMEOUT)
+        return epochs
+
+    @classmethod
+    def started_ids(cls) -> list[int]:
+        """The ids of the epochs that have started, oldest first"""
+        now = timezone.now()
+        return [
+            id
+            for id, started_at, _ in cls._cached_epochs()
+            if started_at <= now
+        ]
+
+    @classmethod
+    def frozen_ids(cls) -> set[int]:
+        return {id for id, _, frozen in cls._cached_epochs() if frozen}
+
+    @classmethod
+    def current_id(cls) -> Optional[int]:
+        started_ids = cls.started_ids()
+        return started_ids[-1] if started_ids else None
+
+    def save(self, *args, **kwargs) -> None:
+        super().save(*args, **kwargs)
+        notify_data_changed(type(self))
+
+    def delete(self, *args, **kwargs) -> tuple[int, dict[str, int]]:
+        result = super().delete(*args, **kwargs)
+        notify_data_changed(type(self))
+        return result
+
+    def __str__(self) -> str:
+        return self.name
 
 
 class BowDamageTrial(models.Model):
@@ -48,11 +134,26 @@ class BowDamageTrial(models.Model):
         validators=[MinValueValidator(0.0)],
         help_text="The average damage per shot to the target dummy's head",
     )
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    epoch = models.ForeignKey(
+        GameEpoch,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        help_text="Defaults to the current epoch",
+    )
 
     class Meta:
         ordering = ("id",)
+        indexes = [
+            models.Index(fields=["bow_type", "range"]),
+            models.Index(fields=["epoch", "bow_type"]),
+        ]
 
     def save(self, *args, **kwargs) -> None:
+        adding = self._state.adding
+        if adding and self.epoch_id is None:
+            self.epoch_id = GameEpoch.current_id()
         # denormalizing bc we'll fit models to these values frequently
         self.mean_damage = sum(map(int, self.damage_log.split())) / 10
         # TODO proper validator
@@ -60,7 +161,13 @@ class BowDamageTrial(models.Model):
             self.durability_current <= self.durability_max
         ), "Invalid durability"
         self.durability_pct = self.durability_current / self.durability_max
-        return super().save(*args, **kwargs)
+        super().save(*args, **kwargs)
+        notify_data_changed(type(self), inserted_only=adding)
+
+    def delete(self, *args, **kwargs) -> tuple[int, dict[str, int]]:
+        result = super().delete(*args, **kwargs)
+        notify_data_changed(type(self))
+        return result
 
     def __str__(self) -> str:
         return f"{self.bow_type} @ {self.range}: {self.mean_damage}"
@@ -71,8 +178,9 @@ class CachedDamagePredictor(models.Model):
     Abstract model for a predictor that is fit using the `target_model`
      instances from the DB that match `queryset_filter`. The result is stored
      in the in-memory cache (shared across gunicorn threads, but not across
-     containers/EC2 instances). The cache is busted whenever there are new rows
-     added for the `target_model`.
+     containers/EC2 instances). The cache is busted whenever rows of the
+     `target_model` are added, edited or deleted, which each container learns
+     about from the notifications described in `data_versions`.
     """
 
     id: int  # stop type complaints for implicit int PK
@@ -91,34 +199,99 @@ class CachedDamagePredictor(models.Model):
         abstract = True
         ordering = ("id",)
 
-    def __init__(self, *args, **kwargs) -> None:
-        super().__init__(*args, **kwargs)
-        if not cache.get(self._cache_key):
-            self.update_and_cache()
+    def update_and_cache(self) -> "CachedDamagePredictor.CachedValueDict":
+        return self.cache_fit(self._fit())
+
+    def cache_fit(
+        self, value: "CachedDamagePredictor.CachedValueDict"
+    ) -> "CachedDamagePredictor.CachedValueDict":
+        """Caches a new fit, e.g. one that was made in another process"""
+        # a frozen predictor's key never changes, so keep it for good
+        cache.set(
+            self._cache_key, value, None if self.frozen else DEFAULT_TIMEOUT
+        )
+        self.fit_cached()
+        return value
+
+    def fit_cached(self) -> None:
+        """Hook that's called after a new fit of the predictor is cached"""
+
+    def get_cached(self) -> Optional["CachedDamagePredictor.CachedValueDict"]:
+        """The cached predictor and summary, if they're up to date"""
+        return cache.get(self._cache_key)
+
+    def get_or_fit(self) -> "CachedDamagePredictor.CachedValueDict":
+        """
+        Returns the cached predictor and summary, fitting them first if the
+         data has changed since they were cached. This is done lazily rather
+         than on instantiation so that e.g. listing predictors stays cheap.
+        """
+        value = self.get_cached()
+        if value is None:
+            value = self.update_and_cache()
+        return value
+
+    @classmethod
+    def get_or_fit_many(
+        cls, predictors: list["CachedDamagePredictor"]
+    ) -> list["CachedDamagePredictor.CachedValueDict"]:
+        """
+        `get_or_fit` for several predictors, e.g. to list them, which looks
+         up each target model's data version once and all the cached fits in
+         a single cache call
+        """
+        data_versions: dict[Type[models.Model], DataVersion] = {}
+        for predictor in predictors:
+            # frozen predictors keep the version they were first fit to
+            if not predictor.frozen:
+                model = predictor.target_model
+                if model not in data_versions:
+                    data_versions[model] = get_data_version(model)
+                predictor.__dict__.setdefault(
+                    "_data_version", data_versions[model]
+                )
+        values = cache.get_many([p._cache_key for p in predictors])
+        return [
+            values.get(predictor._cache_key) or predictor.update_and_cache()
+            for predictor in predictors
+        ]
 
-    def update_and_cache(self) -> None:
-        cache.set(self._cache_key, self._fit())
+    @cached_property
+    def _data_version(self) -> DataVersion:
+        # TODO: consider another cache-busting strategy - this approach doesn't
+        #  account for possible filters
+        return get_data_version(self.target_model)
 
     @cached_property
     def _cache_key(self) -> str:
-        # TODO: consider another cache-busting strategy - this approach doesn't
-        #  account for possible filters but is a guaranteed index-only query
-        last_id = (
-            self.target_model.objects.order_by("id")
-            .values_list("id", flat=True)
-            .last()
-        ) or 0
         # if the instance has no id (not saved in DB), we use its location in
         #  memory to identify it
-        return f"{self._meta.model_name}:{self.id or id(self)}:{last_id}"
+        return (
+            f"{self._meta.model_name}:{self.id or id(self)}:"
+            f"{self._data_version.version}"
+        )
 
     class CachedValueDict(TypedDict):
         predictor: Optional[ResultsWrapper]
         summary: str
 
+    def get_queryset_filter(self) -> dict[str, Any]:
+        """
+        The filter for the data the predictor is fit to, which subclasses
+         can narrow down from `queryset_filter`
+        """
+        return self.queryset_filter
+
+    @property
+    def frozen(self) -> bool:
+        """Whether the predictor's data is final, so it needn't be refit"""
+        return False
+
     def _prepare_dataframe(self) -> DataFrame:
         return DataFrame(
-            self.target_model.objects.filter(**self.queryset_filter).values()
+            self.target_model.objects.filter(
+                **self.get_queryset_filter()
+            ).values()
         )
 
     @abstractmethod
@@ -130,11 +303,11 @@ class CachedDamagePredictor(models.Model):
 
     @property
     def predictor(self) -> Optional[ResultsWrapper]:
-        return cache.get(self._cache_key)["predictor"]
+        return self.get_or_fit()["predictor"]
 
     @property
     def summary(self) -> str:
-        return cache.get(self._cache_key)["summary"]
+        return self.get_or_fit()["summary"]
 
     def predict(self, *args, **kwargs) -> list[float]:
         """
@@ -142,56 +315,235 @@ class CachedDamagePredictor(models.Model):
          observations keyed by regressor name like `{"feature": [...]}` and
          returns a list of predicted values for the observations.
         """
-        if not self.predictor:
+        predictor = self.predictor
+        if not predictor:
             raise RuntimeError("No model available for prediction (no data?)")
-        return list(self.predictor.predict(*args, **kwargs))
+        return list(predictor.predict(*args, **kwargs))
 
     def save(self, *args, **kwargs) -> None:
-        self.update_and_cache()
         super().save(*args, **kwargs)
+        # a new instance only gets its id (and so its real cache key) here
+        self.__dict__.pop("_cache_key", None)
+        self.update_and_cache()
 
 
-class CachedOLSPredictor(CachedDamagePredictor):
+class CachedRegressionPredictor(CachedDamagePredictor):
     """
-    Abstract model for a CachedDamagePredictor that uses OLS regression with
-     the specified `formula` for prediction
+    Abstract model for a CachedDamagePredictor that fits a regression with
+     the specified `formula` using one of the pluggable `estimators`. The
+     design matrices are shared by all predictors with the same data and
+     formula, whatever their estimator.
     """
 
+    class EstimatorChoices(models.TextChoices):
+        OLS = "OLS", "Ordinary least squares"
+        WLS = "WLS", "Weighted least squares"
+        RLM = "RLM", "Robust linear model (Huber)"
+        QUANTREG = "QUANTREG", "Quantile regression"
+
     formula = models.CharField(max_length=500)
+    estimator = models.CharField(
+        max_length=10,
+        choices=EstimatorChoices.choices,
+        default=EstimatorChoices.OLS,
+    )
+    estimator_options = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Extra estimator arguments, e.g. `{"weights": '
+        '"durability_pct"}` for WLS or `{"q": 0.9}` for quantile '
+        "regression",
+    )
+    max_training_rows = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Fit to a uniform sample of at most this many rows, to "
+        "bound the memory and time a fit takes (leave blank to use all rows)",
+    )
 
     class Meta(CachedDamagePredictor.Meta):
         abstract = True
 
-    def _fit(self) -> CachedDamagePredictor.CachedValueDict:
-        df = self._prepare_dataframe()
-        if df.empty:
-            return {
-                "predictor": None,
-                "summary": "No Data",
-            }
+    @property
+    def design_matrices(self) -> Optional[estimators.DesignMatrices]:
+        """The encoded data this predictor is fit to (None if no data)"""
+        return estimators.get_design_matrices(
+            self.target_model,
+            self.get_queryset_filter(),
+            self.formula,
+            self._data_version,
+            self.max_training_rows,
+        )
 
+    def _fit(self) -> CachedDamagePredictor.CachedValueDict:
         try:
-            predictor: ResultsWrapper = ols(
-                formula=self.formula,
-                data=df,
-            ).fit()
-            summary: str = predictor.summary().as_html()
+            design = self.design_matrices
         except Exception as e:
             return {
                 "predictor": None,
                 "summary": repr(e),
             }
-
+        predictor, summary = estimators.fit_and_summarize(
+            self.estimator, design, self.estimator_options
+        )
         return {
             "predictor": predictor,
             "summary": summary,
         }
 
+    def manifest_entry(self) -> Optional[dict[str, Any]]:
+        """
+        Everything a client needs to evaluate this predictor locally as
+         `coefficients . x` (plus intervals from `cov_params` and `scale`),
+         where x holds the value of each of the `terms`. A term's value is
+         the product of its factors, each of which is a patsy expression of
+         the raw regressors. Returns None if there's nothing to evaluate, or
+         if the predictor hasn't been fit to the current data yet (this never
+         fits it).
+        """
+        value = self.get_cached()
+        predictor = value["predictor"] if value else None
+        if predictor is None:
+            return None
+        design_info = predictor.model.data.design_info
+        terms = []
+        for term, columns in design_info.term_slices.items():
+            factors = []
+            for factor in term.factors:
+                factor_info = design_info.factor_infos[factor]
+                factors.append(
+                    {
+                        "code": factor.code,
+                        "type": factor_info.type,
+                        "categories": list(factor_info.categories or []),
+                    }
+                )
+            terms.append(
+                {
+                    "name": term.name(),
+                    "factors": factors,
+                    "columns": design_info.column_names[columns],
+                }
+            )
+        return {
+            "id": self.id,
+            "formula": self.formula,
+            "estimator": self.estimator,
+            "queryset_filter": self.get_queryset_filter(),
+            "data_version": self._data_version.version,
+            "terms": terms,
+            "coefficients": dict(
+                zip(design_info.column_names, map(float, predictor.params))
+            ),
+            "cov_params": predictor.cov_params().to_numpy().tolist(),
+            "scale": float(predictor.scale),
+            "df_resid": float(predictor.df_resid),
+            "nobs": int(predictor.nobs),
+        }
+
     def __str__(self) -> str:
-        return f"{self.formula} for {self.queryset_filter}"
+        estimator = (
+            ""
+            if self.estimator == self.EstimatorChoices.OLS
+            else f" ({self.estimator})"
+        )
+        return f"{self.formula}{estimator} for {self.queryset_filter}"
 
 
-class BowDamagePredictor(CachedOLSPredictor):
-    """A CachedOLSPredictor to predict bow damage"""
+class BowDamagePredictor(CachedRegressionPredictor):
+    """A CachedRegressionPredictor to predict bow damage"""
 
     target_model = BowDamageTrial
+
+    DEFAULT_FORMULA = "mean_damage ~ range"
+    # FIXME what really matters seems to be arrow type not bow type?
+    BOW_TYPE_FILTERS: dict[str, dict[str, Any]] = {
+        BowDamageTrial.BowTypeChoices.LONG: {"bow_type": "LONG"},
+        BowDamageTrial.BowTypeChoices.SHORT: {
+            "bow_type__in": ["SHORT", "ASYM"]
+        },
+        BowDamageTrial.BowTypeChoices.ASYM: {
+            "bow_type__in": ["SHORT", "ASYM"]
+        },
+    }
+
+    epoch = models.ForeignKey(
+        GameEpoch,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        help_text="Only fit to the trials from this epoch",
+    )
+    epoch_window = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        help_text="Only fit to the trials from the latest N epochs, e.g. 1 "
+        "for the current epoch (ignored if `epoch` is set; leave both blank "
+        "to use all history)",
+    )
+
+    @classmethod
+    def default_lookup(cls, bow_type: str) -> dict[str, Any]:
+        """The fields of the predictor used by default for `bow_type`"""
+        # TODO come up w/ a strategy to dynamically select the best model
+        return {
+            "formula": cls.DEFAULT_FORMULA,
+            "estimator": cls.EstimatorChoices.OLS,
+            "estimator_options": {},
+            "queryset_filter": cls.BOW_TYPE_FILTERS[bow_type],
+            "max_training_rows": None,
+            "epoch_id": None,
+            "epoch_window": None,
+        }
+
+    @classmethod
+    def for_bow_type(cls, bow_type: str) -> "BowDamagePredictor":
+        """The predictor used for damage estimates for `bow_type`"""
+        lookup = cls.default_lookup(bow_type)
+        # not `get_or_create`, which fails if there are duplicates
+        predictor = cls.objects.filter(**lookup).first()
+        if predictor is None:
+            predictor = cls.objects.create(**lookup)
+        return predictor
+
+    def get_queryset_filter(self) -> dict[str, Any]:
+        queryset_filter = super().get_queryset_filter()
+        if self.epoch_id:
+            return {**queryset_filter, "epoch_id": self.epoch_id}
+        if self.epoch_window:
+            return {
+                **queryset_filter,
+                "epoch_id__in": GameEpoch.started_ids()[-self.epoch_window :],
+            }
+        return queryset_filter
+
+    @cached_property
+    def _cache_key(self) -> str:
+        key = super()._cache_key
+        if self.epoch_window and not self.epoch_id:
+            # the window moves when epochs are added or changed
+            key += f":{get_data_version(GameEpoch).version}"
+        return key
+
+    @property
+    def frozen(self) -> bool:
+        # from the cached epochs, rather than fetching `self.epoch`
+        return bool(self.epoch_id) and self.epoch_id in GameEpoch.frozen_ids()
+
+    def fit_cached(self) -> None:
+        # imported here since the manifest is built from these models
+        from .manifest import update_manifest
+
+        update_manifest()
+
+    @cached_property
+    def _data_version(self) -> DataVersion:
+        if not self.frozen:
+            return super()._data_version
+        # the epoch's data is final, so the version it's first fit to (and
+        #  with it the cache key) never changes
+        return cache.get_or_set(
+            f"frozen_epoch_version:{self._meta.label_lower}:{self.epoch_id}",
+            lambda: get_data_version(self.target_model),
+            None,
+        )
@@ -0,0 +1,275 @@
+"""
+Bulk refitting of predictors.
+
+`refit_all` refits many predictors from a single scan of their target
+ model's table, rather than one query per predictor. `refit_in_background`
+ refits predictors in a background thread pool so that e.g. an admin action
+ doesn't block the request; its progress is kept in the cache per predictor
+ model, so that it can be reported on later requests.
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Optional, Type, TypedDict
+
+from django.core.cache import cache
+from django.db import connections, models
+from pandas import DataFrame, Series, concat
+
+from mo2info.routers import read_database
+
+from . import estimators, sampling
+from .data_versions import DataVersion, refresh_data_version
+from .models import CachedDamagePredictor, CachedRegressionPredictor
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="refit")
+_progress_lock = threading.Lock()
+
+
+class RefitProgress(TypedDict):
+    total: int
+    done: int
+    failed: list[str]
+    started: float
+    finished: Optional[float]
+
+
+def _progress_key(predictor_model: Type[CachedDamagePredictor]) -> str:
+    return f"refit_progress:{predictor_model._meta.label_lower}"
+
+
+def get_progress(
+    predictor_model: Type[CachedDamagePredictor],
+) -> Optional[RefitProgress]:
+    return cache.get(_progress_key(predictor_model))
+
+
+def _refit(predictor: CachedDamagePredictor, progress: RefitProgress) -> None:
+    try:
+        predictor.update_and_cache()
+    except Exception:
+        logger.exception(f"Failed to refit {predictor}")
+        failed = True
+    else:
+        failed = False
+    finally:
+        # each thread gets its own DB connection, which would otherwise leak
+        connections.close_all()
+
+    with _progress_lock:
+        progress["done"] += 1
+        if failed:
+            progress["failed"].append(str(predictor))
+        if progress["done"] == progress["total"]:
+            progress["finished"] = time.time()
+        cache.set(_progress_key(type(predictor)), progress)
+
+
+def refit_in_background(predictors: Iterable[CachedDamagePredictor]) -> int:
+    """
+    Refits `predictors` in parallel in the background and returns how many
+     were queued. They must all be instances of the same predictor model.
+    """
+    predictors = list(predictors)
+    if not predictors:
+        return 0
+    progress: RefitProgress = {
+        "total": len(predictors),
+        "done": 0,
+        "failed": [],
+        "started": time.time(),
+        "finished": None,
+    }
+    cache.set(_progress_key(type(predictors[0])), progress)
+    for predictor in predictors:
+        _executor.submit(_refit, predictor, progress)
+    return len(predictors)
+
+
+_LOOKUPS: dict[str, Callable[[Series, Any], Series]] = {
+    "exact": lambda column, value: column == value,
+    "iexact": lambda column, value: column.str.lower() == value.lower(),
+    "in": lambda column, value: column.isin(value),
+    "gt": lambda column, value: column > value,
+    "gte": lambda column, value: column >= value,
+    "lt": lambda column, value: column < value,
+    "lte": lambda column, value: column <= value,
+    "range": lambda column, value: column.between(*value),
+    "isnull": lambda column, value: column.isna() == value,
+}
+
+
+def filter_mask(frame: DataFrame, queryset_filter: dict) -> Optional[Series]:
+    """
+    Evaluates `queryset_filter` against the rows of `frame` (as returned by
+     `.values()`) in memory. Returns None if the filter uses lookups that
+     aren't supported here, e.g. across relations.
+    """
+    mask = Series(True, index=frame.index)
+    for key, value in queryset_filter.items():
+        field, _, lookup = key.partition("__")
+        if field not in frame.columns or (lookup or "exact") not in _LOOKUPS:
+            return None
+        mask &= _LOOKUPS[lookup or "exact"](frame[field], value)
+    return mask
+
+
+PartitionKey = tuple[str, Optional[int]]  # (filter JSON, max_training_rows)
+
+
+def _partition_key(predictor: CachedRegressionPredictor) -> PartitionKey:
+    return (
+        json.dumps(predictor.get_queryset_filter(), sort_keys=True),
+        predictor.max_training_rows,
+    )
+
+
+def _scan_partitions(
+    target_model: Type[models.Model],
+    predictors: Iterable[CachedRegressionPredictor],
+    data_version: DataVersion,
+) -> dict[PartitionKey, tuple[DataFrame, Optional[int]]]:
+    """
+    Streams `target_model`'s rows as of `data_version` once, in chunks, and
+     routes each row to the partition of every predictor filter it matches.
+     Partitions with a row budget only keep a sample (see `sampling`), so
+     memory stays bounded. Returns the rows of each partition, and the number
+     of rows that matched if they were sampled. Partitions whose filter can't
+     be evaluated in memory are left out.
+    """
+    filters = {}
+    for predictor in predictors:
+        filters[_partition_key(predictor)] = predictor.get_queryset_filter()
+    chunks: dict[PartitionKey, list[DataFrame]] = defaultdict(list)
+    samples = {
+        key: sampling.TrainingSample(key[1]) for key in filters if key[1]
+    }
+
+    queryset = (
+        target_model._default_manager.using(
+            read_database(target_model, data_version)
+        )
+        .filter(id__lte=data_version.last_id)
+        .order_by()
+    )
+    columns = None
+    for frame in sampling.iter_chunks(queryset):
+        columns = frame.columns
+        for key, queryset_filter in list(filters.items()):
+            mask = filter_mask(frame, queryset_filter)
+            if mask is None:
+                del filters[key]
+            elif key in samples:
+                samples[key].add(frame[mask])
+            else:
+                chunks[key].append(frame[mask])
+
+    partitions: dict[PartitionKey, tuple[DataFrame, Optional[int]]] = {}
+    for key, queryset_filter in filters.items():
+        if key in samples:
+            sample = samples[key]
+            # so that the next fit only needs to read newer rows
+            sampling.cache_sample(
+                target_model, queryset_filter, data_version, sample
+            )
+            partitions[key] = (sample.frame, sample.population)
+        elif chunks[key]:
+            partitions[key] = (concat(chunks[key], ignore_index=True), None)
+        else:
+            partitions[key] = (DataFrame(columns=columns), None)
+    return partitions
+
+
+def refit_all(
+    predictors: Iterable[CachedDamagePredictor], processes: int = 0
+) -> None:
+    """
+    Refits `predictors` from a single scan of each target model's table,
+     optionally solving the models across a pool of `processes`. Predictors
+     whose data can't be partitioned in memory are refit individually.
+    """
+    by_target: dict[
+        Type[models.Model], list[CachedDamagePredictor]
+    ] = defaultdict(list)
+    for predictor in predictors:
+        by_target[predictor.target_model].append(predictor)
+
+    pool = ProcessPoolExecutor(processes) if processes else None
+    try:
+        for target_model, target_predictors in by_target.items():
+            _refit_target(target_model, target_predictors, pool)
+    finally:
+        if pool:
+            pool.shutdown()
+
+
+def _refit_target(
+    target_model: Type[models.Model],
+    predictors: list[CachedDamagePredictor],
+    pool: Optional[ProcessPoolExecutor],
+) -> None:
+    # the predictors will also pick this version up from the cache, so that
+    #  they're cached under the same version that we scan
+    data_version = refresh_data_version(target_model)
+    regressions = [
+        predictor
+        for predictor in predictors
+        if isinstance(predictor, CachedRegressionPredictor)
+        and not predictor.frozen
+    ]
+    partitions = _scan_partitions(target_model, regressions, data_version)
+
+    futures = []
+    for predictor in predictors:
+        if predictor.frozen:
+            # its data can't have changed, so it only needs fitting once
+            predictor.get_or_fit()
+            continue
+        partition = (
+            partitions.get(_partition_key(predictor))
+            if isinstance(predictor, CachedRegressionPredictor)
+            else None
+        )
+        if partition is None:
+            predictor.update_and_cache()
+            continue
+        frame, population = partition
+        # so the fit is cached under the version that was scanned, even if
+        #  the data changes while it's being solved
+        predictor.__dict__["_data_version"] = data_version
+        predictor.__dict__.pop("_cache_key", None)
+        if pool:
+            futures.append(
+                (
+                    predictor,
+                    pool.submit(
+                        estimators.fit_frame,
+                        predictor.estimator,
+                        frame,
+                        predictor.formula,
+                        predictor.estimator_options,
+                        population,
+                    ),
+                )
+            )
+        else:
+            # the predictor picks up the seeded matrices when it's refit
+            estimators.seed_design_matrices(
+                target_model,
+                predictor.get_queryset_filter(),
+                predictor.formula,
+                data_version,
+                frame,
+                predictor.max_training_rows,
+                population,
+            )
+            predictor.update_and_cache()
+
+    for predictor, future in futures:
+        fitted, summary = future.result()
+        predictor.cache_fit({"predictor": fitted, "summary": summary})
@@ -0,0 +1,162 @@
+"""
+Bounded-memory training samples for predictors with a `max_training_rows`.
+
+A `TrainingSample` keeps the rows with the smallest hash of their id, which
+ is a uniform random sample (like a reservoir sample) but deterministic: the
+ same rows are picked no matter what order they're read in, so the sample can
+ be built by streaming the table in chunks and then maintained incrementally
+ by only reading the rows added since, for as long as the data's
+ `generation` shows that no existing rows were edited or deleted. Since
+ concurrent inserts can commit out of id order, the rows within `ID_MARGIN`
+ of the last sampled id are read again too.
+"""
+import copy
+import json
+import threading
+from collections import OrderedDict
+from itertools import islice
+from typing import Iterator, Type
+
+import numpy as np
+from django.db import models
+from pandas import DataFrame, Series, concat
+
+from mo2info.routers import read_database
+
+from .data_versions import DataVersion
+
+# rows per chunk when streaming a table
+CHUNK_SIZE = 2000
+
+# how far below the last sampled id rows are read again when a sample is
+#  extended, in case they were committed after rows with higher ids
+ID_MARGIN = 1000
+
+_SAMPLE_KEY = "_sample_key"
+
+
+def iter_chunks(queryset: models.QuerySet) -> Iterator[DataFrame]:
+    """Streams `queryset.values()` as DataFrames of CHUNK_SIZE rows"""
+    rows = queryset.values().iterator(chunk_size=CHUNK_SIZE)
+    while chunk := list(islice(rows, CHUNK_SIZE)):
+        yield DataFrame(chunk)
+
+
+def _hash_ids(ids: Series) -> np.ndarray:
+    # a cheap multiplicative hash, to spread the (sequential) ids uniformly
+    hashed = ids.to_numpy(dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return hashed ^ (hashed >> np.uint64(31))
+
+
+class TrainingSample:
+    """A uniform sample of at most `size` of the rows `add`ed to it"""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.population = 0  # how many rows have been added in total
+        self._frame = DataFrame()
+        # the ids added within ID_MARGIN of the last one, so that rows that
+        #  are read again aren't counted twice
+        self._recent_ids: set[int] = set()
+
+    def add(self, chunk: DataFrame) -> None:
+        if self._recent_ids and not chunk.empty:
+            chunk = chunk[~chunk["id"].isin(self._recent_ids)]
+        if chunk.empty:
+            return
+        recent_ids = self._recent_ids.union(chunk["id"])
+        cutoff = max(recent_ids) - ID_MARGIN
+        self._recent_ids = {id for id in recent_ids if id > cutoff}
+        self.population += len(chunk)
+        chunk = chunk.assign(**{_SAMPLE_KEY: _hash_ids(chunk["id"])})
+        # every chunk is indexed from 0, and the index has to stay unique
+        frame = (
+            concat([self._frame, chunk], ignore_index=True)
+            if len(self._frame)
+            else chunk
+        )
+        if len(frame) > self.size:
+            frame = frame.nsmallest(self.size, _SAMPLE_KEY)
+        self._frame = frame
+
+    @property
+    def frame(self) -> DataFrame:
+        return self._frame.drop(columns=_SAMPLE_KEY, errors="ignore")
+
+
+SAMPLE_CACHE_SIZE = 16
+
+_samples: "OrderedDict[tuple, tuple[DataVersion, TrainingSample]]" = (
+    OrderedDict()
+)
+_samples_lock = threading.Lock()
+
+
+def _sample_cache_key(
+    target_model: Type[models.Model], queryset_filter: dict, size: int
+) -> tuple:
+    return (
+        target_model._meta.label,
+        json.dumps(queryset_filter, sort_keys=True),
+        size,
+    )
+
+
+def cache_sample(
+    target_model: Type[models.Model],
+    queryset_filter: dict,
+    data_version: DataVersion,
+    sample: TrainingSample,
+) -> None:
+    """Keeps `sample` as of `data_version` to be updated incrementally"""
+    key = _sample_cache_key(target_model, queryset_filter, sample.size)
+    with _samples_lock:
+        _samples[key] = (data_version, sample)
+        _samples.move_to_end(key)
+        while len(_samples) > SAMPLE_CACHE_SIZE:
+            _samples.popitem(last=False)
+
+
+def get_sample(
+    target_model: Type[models.Model],
+    queryset_filter: dict,
+    size: int,
+    data_version: DataVersion,
+) -> TrainingSample:
+    """
+    Returns the sample of `target_model.objects.filter(**queryset_filter)`
+     as of `data_version`, reading only the rows added since the last sample
+     (if there is one)
+    """
+    key = _sample_cache_key(target_model, queryset_filter, size)
+    with _samples_lock:
+        cached = _samples.get(key)
+    if (
+        cached
+        and cached[0].generation == data_version.generation
+        and cached[0].last_id <= data_version.last_id
+    ):
+        if cached[0].version == data_version.version:
+            return cached[1]
+        # a row can be committed late with a lower id than the last one
+        #  (even without the last id changing), so read some before it too
+        min_id = max(cached[0].last_id - ID_MARGIN, 0)
+        sample = copy.copy(cached[1])
+    else:
+        min_id, sample = 0, TrainingSample(size)
+
+    queryset = (
+        target_model._default_manager.using(
+            read_database(target_model, data_version)
+        )
+        .filter(
+            id__gt=min_id,
+            id__lte=data_version.last_id,
+            **queryset_filter,
+        )
+        .order_by()
+    )
+    for chunk in iter_chunks(queryset):
+        sample.add(chunk)
+    cache_sample(target_model, queryset_filter, data_version, sample)
+    return sample
@@ -2,11 +2,27 @@ import csv
 
 from django.core.exceptions import ValidationError
 from django.forms import ModelForm
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views import View
 from django.views.generic import CreateView, FormView, ListView, TemplateView
 
-from .models import BowDamagePredictor, BowDamageTrial
+from mo2info.profiling import RequestBudget
+from mo2info.routers import replica_reads
+
+from .manifest import get_manifest
+from .models import BowDamagePredictor, BowDamageTrial, GameEpoch
+
+
+class ReplicaReadMixin:
+    """Sends the DB reads made while handling the request to the replica"""
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads():
+            return super().dispatch(  # type: ignore[misc]
+                request, *args, **kwargs
+            )
 
 
 class HomeView(TemplateView):
@@ -31,16 +47,20 @@ class BowDamageTrialCreateView(CreateView):
         return reverse("bow-damage-contribute")
 
 
-class BowDamagePredictorSummaryView(TemplateView):
+class BowDamagePredictorSummaryView(ReplicaReadMixin, TemplateView):
     """Lists summary data for alternative bow damage models"""
 
     template_name = "main/predictor_summary.html"
+    request_budget = RequestBudget(queries=1, cache_calls=2)
 
     def get_context_data(self, **kwargs) -> dict:
         context = super().get_context_data(**kwargs)
-        context["summaries"] = []
-        for predictor in BowDamagePredictor.objects.all():
-            context["summaries"].append((str(predictor), predictor.summary))
+        predictors = list(BowDamagePredictor.objects.all())
+        values = BowDamagePredictor.get_or_fit_many(predictors)
+        context["summaries"] = [
+            (str(predictor), value["summary"])
+            for predictor, value in zip(predictors, values)
+        ]
         return context
 
 
@@ -51,15 +71,7 @@ class BowDamagePredictionForm(ModelForm):
         #  form error, which conveniently takes you back to the form with
         #  the previous values still filled in
         cleaned_data = super().clean()
-        # FIXME what really matters seems to be arrow type not bow type?
-        if cleaned_data["bow_type"] == "LONG":
-            filter = {"bow_type": "LONG"}
-        else:
-            filter = {"bow_type__in": ["SHORT", "ASYM"]}
-        # TODO come up w/ a strategy to dynamically select the best model
-        predictor, _ = BowDamagePredictor.objects.get_or_create(
-            formula="mean_damage ~ range", queryset_filter=filter
-        )
+        predictor = BowDamagePredictor.for_bow_type(cleaned_data["bow_type"])
         damage = predictor.predict({"range": [cleaned_data["range"]]})[0]
         raise ValidationError(
             f"Estimated average damage per shot: {round(damage)}"
@@ -73,17 +85,59 @@ class BowDamagePredictionForm(ModelForm):
 class BowDamagePredictionView(FormView):
     form_class = BowDamagePredictionForm
     template_name = "main/predict.html"
+    request_budget = RequestBudget(
+        queries=1,
+        cache_calls=2,
+        method="POST",
+        data={"bow_type": "LONG", "range": 40},
+    )
+
+
+class BowDamagePredictionManifestView(View):
+    """
+    Serves the versioned manifest of all bow damage predictors so that
+     clients can compute predictions locally; see `manifest`
+    """
+
+    def get(self, request, *args, **kwargs):
+        manifest = get_manifest()
+        etag = f'"{manifest["version"]}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = JsonResponse(manifest)
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, max_age=60)
+        return response
 
 
-class BowDamageTrialDownloadView(ListView):
-    """Allows downloading all the bow damage data as a CSV"""
+class BowDamageTrialDownloadView(ReplicaReadMixin, ListView):
+    """
+    Allows downloading the bow damage data as a CSV, optionally for just one
+     epoch (`?epoch=<id>` or `?epoch=current`)
+    """
 
     model = BowDamageTrial
+    request_budget = RequestBudget(queries=1, cache_calls=0)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        epoch = self.request.GET.get("epoch")
+        if not epoch:
+            return queryset
+        if epoch == "current":
+            epoch_id = GameEpoch.current_id()
+            if epoch_id is None:
+                return queryset.none()
+        elif epoch.isdigit():
+            epoch_id = int(epoch)
+        else:
+            raise Http404(f"Invalid epoch: {epoch}")
+        return queryset.filter(epoch_id=epoch_id)
 
     def render_to_response(self, context, **response_kwargs):
         values_as_list = context["object_list"].values()
         if not values_as_list:
-            raise BowDamageTrial.DoesNotExist()
+            raise Http404("No trials")
 
         response = HttpResponse(
             content_type="text/csv",
@@ -0,0 +1,169 @@
+"""
+Per-request profiling: the SQL queries, cache calls and (on demand) a
+ cProfile report of a single request.
+
+Staff users can add `?profile` to any URL (or send an `X-Profile` header) to
+ get the report instead of the normal response. Views can also declare a
+ `request_budget`, which `python manage.py check_request_budgets` enforces.
+"""
+import cProfile
+import io
+import pstats
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+
+# the cache backend methods that are counted; note that some of them call
+#  others internally (e.g. `get_or_set`), which are counted too, except in
+#  the `*_many` methods, which are one round trip to e.g. memcached even if
+#  the backend in use (e.g. locmem) calls `get` etc. per key
+CACHE_METHODS = (
+    "add",
+    "clear",
+    "decr",
+    "delete",
+    "delete_many",
+    "get",
+    "get_many",
+    "get_or_set",
+    "has_key",
+    "incr",
+    "set",
+    "set_many",
+    "touch",
+)
+
+
+class RequestBudget(NamedTuple):
+    """The most queries and cache calls a (warm) request to a view may make"""
+
+    queries: int
+    cache_calls: int
+    method: str = "GET"
+    data: Optional[dict[str, Any]] = None  # the GET or POST data to send
+
+
+@dataclass
+class RequestStats:
+    queries: list[tuple[str, str, float]] = field(default_factory=list)
+    cache_calls: Counter = field(default_factory=Counter)
+
+    def report(self) -> str:
+        lines = [f"{len(self.queries)} SQL queries:"]
+        for alias, sql, duration in self.queries:
+            lines.append(f"  [{alias}] {duration * 1000:.1f}ms {sql}")
+        lines.append(f"{sum(self.cache_calls.values())} cache calls:")
+        for call, count in sorted(self.cache_calls.items()):
+            lines.append(f"  {count} x {call}")
+        return "\n".join(lines)
+
+
+def _query_recorder(stats: RequestStats, alias: str) -> Callable:
+    def record(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats.queries.append((alias, sql, time.perf_counter() - start))
+
+    return record
+
+
+def _cache_call_counter(
+    stats: RequestStats, name: str, method: Callable, batching: list[bool]
+) -> Callable:
+    # `batching` is shared by the backend's counters, and set during a
+    #  `*_many` call so that the calls it makes per key aren't counted
+    def count(*args, **kwargs):
+        if batching[0]:
+            return method(*args, **kwargs)
+        stats.cache_calls[name] += 1
+        if not name.endswith("_many"):
+            return method(*args, **kwargs)
+        batching[0] = True
+        try:
+            return method(*args, **kwargs)
+        finally:
+            batching[0] = False
+
+    return count
+
+
+@contextmanager
+def _counting_cache_calls(stats: RequestStats, alias: str) -> Iterator[None]:
+    # cache backends are per-thread, so this only counts this thread's calls
+    backend = caches[alias]
+    batching = [False]
+    for method in CACHE_METHODS:
+        setattr(
+            backend,
+            method,
+            _cache_call_counter(
+                stats, f"{alias}.{method}", getattr(backend, method), batching
+            ),
+        )
+    try:
+        yield
+    finally:
+        for method in CACHE_METHODS:
+            delattr(backend, method)
+
+
+@contextmanager
+def record_request_stats() -> Iterator[RequestStats]:
+    """Records the SQL queries and cache calls made inside the block"""
+    stats = RequestStats()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(
+                connections[alias].execute_wrapper(
+                    _query_recorder(stats, alias)
+                )
+            )
+        for alias in settings.CACHES:
+            stack.enter_context(_counting_cache_calls(stats, alias))
+        yield stats
+
+
+class ProfilingMiddleware:
+    """
+    Replaces the response with a profiling report if a staff user asks for
+     one with `?profile` or an `X-Profile` header
+    """
+
+    def __init__(self, get_response: Callable) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if not (
+            ("profile" in request.GET or "HTTP_X_PROFILE" in request.META)
+            and request.user.is_staff
+        ):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        with record_request_stats() as stats:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+
+        profile = io.StringIO()
+        pstats.Stats(profiler, stream=profile).sort_stats(
+            "cumulative"
+        ).print_stats(50)
+        return HttpResponse(
+            f"{request.method} {request.get_full_path()} -> "
+            f"{response.status_code}\n\n{stats.report()}\n\n"
+            f"{profile.getvalue()}",
+            content_type="text/plain",
+            status=response.status_code,
+        )
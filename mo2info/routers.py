@@ -0,0 +1,107 @@
+"""
+Sends heavy analytical reads (predictor fits, model summaries, CSV exports)
+ to a read replica, when one is configured as `DATABASES["replica"]`, so that
+ they don't compete with contributions on the primary.
+
+Only reads made inside `replica_reads()` go to the replica; everything else
+ uses the primary as usual. After a client makes a write, its requests are
+ pinned to the primary for `settings.REPLICA_LAG_SECONDS` so that it always
+ sees its own contribution.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional, Type
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models
+from django.http import HttpRequest, HttpResponse
+
+from mo2info.main.data_versions import DataVersion, stored_version
+
+REPLICA_DB_ALIAS = "replica"
+
+_replica_reads: ContextVar[bool] = ContextVar("replica_reads", default=False)
+_pinned_to_primary: ContextVar[bool] = ContextVar(
+    "pinned_to_primary", default=False
+)
+
+
+def replica_enabled() -> bool:
+    return (
+        REPLICA_DB_ALIAS in settings.DATABASES and not _pinned_to_primary.get()
+    )
+
+
+@contextmanager
+def replica_reads() -> Iterator[None]:
+    """Routes the reads made inside the block to the replica (if enabled)"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def read_database(
+    model: Type[models.Model], data_version: Optional[DataVersion] = None
+) -> str:
+    """
+    The DB alias to read `model` from for an analytical query that must see
+     at least `data_version` of its data: the replica if it has caught up to
+     that version (which changes on edits and deletes too, unlike the last
+     row), the primary otherwise
+    """
+    if not replica_enabled():
+        return DEFAULT_DB_ALIAS
+    if data_version and (
+        stored_version(model, REPLICA_DB_ALIAS) < data_version.version
+    ):
+        return DEFAULT_DB_ALIAS
+    return REPLICA_DB_ALIAS
+
+
+class ReplicaRouter:
+    def db_for_read(self, model: Type[models.Model], **hints) -> Optional[str]:
+        if _replica_reads.get() and replica_enabled():
+            return REPLICA_DB_ALIAS
+        return None
+
+    def db_for_write(
+        self, model: Type[models.Model], **hints
+    ) -> Optional[str]:
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints) -> Optional[bool]:
+        # the replica has the same data as the primary
+        return True
+
+    def allow_migrate(self, db: str, app_label: str, **hints) -> bool:
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pins a client to the primary for `settings.REPLICA_LAG_SECONDS` after it
+     makes a write (any request with an unsafe method), using a cookie
+    """
+
+    COOKIE_NAME = "pin_primary"
+
+    def __init__(self, get_response: Callable) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        token = _pinned_to_primary.set(self.COOKIE_NAME in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned_to_primary.reset(token)
+        if request.method not in ("GET", "HEAD", "OPTIONS", "TRACE"):
+            response.set_cookie(
+                self.COOKIE_NAME,
+                "1",
+                max_age=settings.REPLICA_LAG_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
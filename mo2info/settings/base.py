@@ -39,11 +39,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
+    "mo2info.routers.ReadYourWritesMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "mo2info.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "mo2info.urls"
@@ -66,6 +68,12 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "mo2info.wsgi.application"
 
+# Analytical reads go to `DATABASES["replica"]` if it's defined; see
+#  `mo2info.routers`
+DATABASE_ROUTERS = ["mo2info.routers.ReplicaRouter"]
+# How long (in seconds) a client's reads stay on the primary after it writes
+REPLICA_LAG_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -144,3 +152,17 @@ CACHES = {
         "TIMEOUT": 60 * 60 * 24,  # 1 day
     }
 }
+
+# Writes to the data that predictors are fit to are announced on this
+#  Postgres NOTIFY channel; see `mo2info.main.data_versions`
+DATA_CHANGED_CHANNEL = "mo2info_data_changed"
+# Upper bound (in seconds) on how stale a container's data version can get if
+#  it misses a notification
+DATA_VERSION_TIMEOUT = 5 * 60
+
+# Where to write the client-side prediction manifest whenever a predictor is
+#  refit, e.g. to serve it as a static file (set to None to disable); see
+#  `mo2info.main.manifest`
+PREDICTION_MANIFEST_PATH = str(
+    BASE_DIR.parent / "manifests" / "bow-damage.json"
+)
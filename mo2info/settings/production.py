@@ -21,5 +21,16 @@ DATABASES = {
         "PASSWORD": os.environ["RDS_PASSWORD"],
         "HOST": os.environ["RDS_HOSTNAME"],
         "PORT": os.environ["RDS_PORT"],
+        # keep each gunicorn worker's connection open between requests
+        #  instead of paying for the connection setup every time
+        "CONN_MAX_AGE": 10 * 60,
+        "CONN_HEALTH_CHECKS": True,
     }
 }
+
+if "RDS_REPLICA_HOSTNAME" in os.environ:
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "HOST": os.environ["RDS_REPLICA_HOSTNAME"],
+        "PORT": os.environ.get("RDS_REPLICA_PORT", os.environ["RDS_PORT"]),
+    }
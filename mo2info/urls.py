@@ -17,6 +17,7 @@ from django.contrib import admin
 from django.urls import path
 
 from mo2info.main.views import (
+    BowDamagePredictionManifestView,
     BowDamagePredictionView,
     BowDamagePredictorSummaryView,
     BowDamageTrialCreateView,
@@ -32,6 +33,11 @@ urlpatterns = [
         BowDamagePredictionView.as_view(),
         name="bow-damage-prediction",
     ),
+    path(
+        "bow-damage/manifest.json",
+        BowDamagePredictionManifestView.as_view(),
+        name="bow-damage-manifest",
+    ),
     path(
         "bow-damage/summary/",
         BowDamagePredictorSummaryView.as_view(),